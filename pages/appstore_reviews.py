@@ -1,29 +1,34 @@
 import os
 import sys
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import streamlit as st
 import openai
 from openai import OpenAI
-import toml
 from pydantic import BaseModel, Field
 from typing import List
 from datetime import datetime, timedelta
 import json
-import base64
-from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
+import asyncio
+import hashlib
+import tempfile
+import logging
+from anthropic import Anthropic, AsyncAnthropic, HUMAN_PROMPT, AI_PROMPT
 
 # imports for RAG
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import faiss
-import re
 
 # Add the parent directory to sys.path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
+from pages.utils.secrets_loader import load_secrets
+
 # Set page configuration
 st.set_page_config(
     page_title="App Review Analysis",
@@ -41,35 +46,42 @@ This app retrieves App Store reviews for **Facetune**, analyzes them, and presen
 secrets_path = os.path.join(
     os.path.dirname(os.path.dirname(__file__)), ".streamlit", "secrets.toml"
 )
-if os.path.exists(secrets_path):
-    with open(secrets_path, "r") as f:
-        secrets = toml.load(f)
-    appfollow_api_token = secrets.get("APPFOLLOW_API_TOKEN")
-    openai_api_key = secrets.get("OPENAI_API_KEY")
-    anthropic_api_key = secrets.get("ANTHROPIC_API_KEY")
-    
-    if not appfollow_api_token:
-        st.error("APPFOLLOW_API_TOKEN is missing in the secrets.toml file.")
-        st.stop()
-    if not openai_api_key:
-        st.error("OPENAI_API_KEY is missing in the secrets.toml file.")
-        st.stop()
-    if not anthropic_api_key:
-        st.error("ANTHROPIC_API_KEY is missing in the secrets.toml file.")
-        st.stop()
-else:
+try:
+    secrets = load_secrets(secrets_path)
+except FileNotFoundError:
     st.error("Secrets file not found. Please make sure you have a secrets.toml file in the .streamlit directory.")
     st.stop()
 
+appfollow_api_token = secrets.get("APPFOLLOW_API_TOKEN")
+openai_api_key = secrets.get("OPENAI_API_KEY")
+anthropic_api_key = secrets.get("ANTHROPIC_API_KEY")
+
+if not appfollow_api_token:
+    st.error("APPFOLLOW_API_TOKEN is missing in the secrets.toml file.")
+    st.stop()
+if not openai_api_key:
+    st.error("OPENAI_API_KEY is missing in the secrets.toml file.")
+    st.stop()
+if not anthropic_api_key:
+    st.error("ANTHROPIC_API_KEY is missing in the secrets.toml file.")
+    st.stop()
+
 # Set OpenAI API key
 openai.api_key = openai_api_key
 
-# Replace OpenAI client setup with Anthropic client
-anthropic = Anthropic(api_key=anthropic_api_key)
+# Replace OpenAI client setup with Anthropic client, created once per process
+# so its connection pool is reused across reruns
+@st.cache_resource(show_spinner=False)
+def get_anthropic_client(api_key):
+    return Anthropic(api_key=api_key)
+
+anthropic = get_anthropic_client(anthropic_api_key)
 
 # Add this near the top of your file, after imports
 if 'reviews' not in st.session_state:
     st.session_state.reviews = None
+if 'review_downloads' not in st.session_state:
+    st.session_state.review_downloads = None
 if 'analysis_result' not in st.session_state:
     st.session_state.analysis_result = None
 if 'review_texts' not in st.session_state:
@@ -80,11 +92,18 @@ if 'faiss_index' not in st.session_state:
     st.session_state.faiss_index = None
 if 'review_embeddings' not in st.session_state:
     st.session_state.review_embeddings = None
-if 'embedding_model' not in st.session_state:
-    st.session_state.embedding_model = None
+
+# Shared HTTP session so TCP/TLS connections to AppFollow are kept alive
+# across pages and reruns
+@st.cache_resource(show_spinner=False)
+def get_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+    session.mount("https://", adapter)
+    return session
 
 # Function to fetch reviews from AppFollow API
-def fetch_reviews(ext_id, from_date, to_date, page=1):
+def fetch_reviews(session, ext_id, from_date, to_date, page=1):
     url = "https://api.appfollow.io/api/v2/reviews"
     headers = {
         'X-AppFollow-API-Token': appfollow_api_token
@@ -95,45 +114,55 @@ def fetch_reviews(ext_id, from_date, to_date, page=1):
         'to': to_date,
         'page': page
     }
-    response = requests.get(url, headers=headers, params=params)
+    response = session.get(url, headers=headers, params=params)
     return response
 
-# Function to paginate through all reviews
+# Function to fetch a single page and return its 'reviews' block. Also runs on
+# worker threads, so the session is passed in rather than looked up there
+def fetch_review_page(session, ext_id, from_date, to_date, page):
+    response = fetch_reviews(session, ext_id, from_date, to_date, page)
+    if response.status_code != 200:
+        raise requests.HTTPError(f"{response.status_code} - {response.text}", response=response)
+    return response.json().get('reviews', {})
+
+# Function to paginate through all reviews. Results are cached for an hour so
+# re-running an analysis on the same date range skips the AppFollow round
+# trips; errors raise instead of returning, so they are never cached.
+# The first page is fetched on its own to learn the page size; the rest are
+# fetched in windows of REVIEW_FETCH_WORKERS pages at a time, stopping at the
+# first empty page or the page without a 'next' link
+REVIEW_FETCH_WORKERS = 8
+
+@st.cache_data(ttl=3600, show_spinner=False)
 def get_all_reviews(ext_id, from_date, to_date, max_reviews=2500):
-    reviews = []
-    page = 1
-    total_fetched = 0
-    while total_fetched < max_reviews:
-        response = fetch_reviews(ext_id, from_date, to_date, page)
-        if response.status_code != 200:
-            st.error(f"Error fetching reviews: {response.status_code} - {response.text}")
-            return None
-        data = response.json()
-        review_list = data.get('reviews', {}).get('list', [])
-        if not review_list:
-            break
-        reviews.extend(review_list)
-        total_fetched += len(review_list)
-        page_info = data.get('reviews', {}).get('page', {})
-        if not page_info.get('next'):
-            break
-        page += 1
+    session = get_http_session()
+    first_page = fetch_review_page(session, ext_id, from_date, to_date, 1)
+    reviews = list(first_page.get('list', []))
+    if not reviews or not first_page.get('page', {}).get('next'):
+        return reviews[:max_reviews]
+
+    page_size = len(reviews)
+    last_page = -(-max_reviews // page_size)
+    page = 2
+    with ThreadPoolExecutor(max_workers=REVIEW_FETCH_WORKERS) as executor:
+        while page <= last_page:
+            window = range(page, min(page + REVIEW_FETCH_WORKERS, last_page + 1))
+            results = executor.map(lambda p: fetch_review_page(session, ext_id, from_date, to_date, p), window)
+            finished = False
+            for result in results:
+                review_list = result.get('list', [])
+                if not review_list:
+                    finished = True
+                    break
+                reviews.extend(review_list)
+                if not result.get('page', {}).get('next'):
+                    finished = True
+                    break
+            if finished:
+                break
+            page += REVIEW_FETCH_WORKERS
     return reviews[:max_reviews]
 
-# Function to create a download link
-def get_download_link(data, filename, file_label='File'):
-    if isinstance(data, pd.DataFrame):
-        csv = data.to_csv(index=False)
-        b64 = base64.b64encode(csv.encode()).decode()
-    elif isinstance(data, list) or isinstance(data, dict):
-        json_str = json.dumps(data, indent=2)
-        b64 = base64.b64encode(json_str.encode()).decode()
-    else:
-        raise ValueError("Unsupported data type for download")
-    
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">{file_label}</a>'
-    return href
-
 # Define Pydantic models for GPT output
 class Feature(BaseModel):
     feature_name: str = Field(..., description="Name of the feature")
@@ -144,6 +173,61 @@ class AnalysisResult(BaseModel):
     most_loved: List[Feature] = Field(..., description="List of most-loved features")
     least_loved: List[Feature] = Field(..., description="List of least-loved features")
 
+# Function to build the arguments that force Claude to answer through a
+# single tool, so the reply arrives as structured tool input instead of JSON
+# embedded in prose
+def structured_request_args(tool_name, tool_description, input_schema):
+    return {
+        "tools": [{"name": tool_name, "description": tool_description, "input_schema": input_schema}],
+        "tool_choice": {"type": "tool", "name": tool_name}
+    }
+
+# Function to read the tool input from a forced-tool reply. Falls back to
+# parsing the text reply as JSON if no tool call comes back. A reply cut off
+# at max_tokens would carry partial input, so it raises instead
+def parse_structured_response(response):
+    if response.stop_reason == "max_tokens":
+        raise ValueError("the response was cut off at the max_tokens limit")
+    for block in response.content:
+        if block.type == "tool_use":
+            return block.input
+    return json.loads(response.content[0].text)
+
+# Function to call Claude with a single forced tool and return its input
+def create_structured_response(tool_name, tool_description, input_schema, **kwargs):
+    response = anthropic.messages.create(
+        **structured_request_args(tool_name, tool_description, input_schema),
+        **kwargs
+    )
+    return parse_structured_response(response)
+
+# Async counterpart of create_structured_response for an AsyncAnthropic client
+async def acreate_structured_response(client, tool_name, tool_description, input_schema, **kwargs):
+    response = await client.messages.create(
+        **structured_request_args(tool_name, tool_description, input_schema),
+        **kwargs
+    )
+    return parse_structured_response(response)
+
+# Schema of the reply requested by elaborate_features_batch
+ELABORATIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "elaborations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "feature_name": {"type": "string", "description": "Exact feature name as given"},
+                    "analysis": {"type": "string", "description": "Markdown analysis of the feature"}
+                },
+                "required": ["feature_name", "analysis"]
+            }
+        }
+    },
+    "required": ["elaborations"]
+}
+
 # Function to elaborate on a feature
 def elaborate_feature(feature_name):
     # Retrieve relevant reviews
@@ -178,6 +262,74 @@ def elaborate_feature(feature_name):
         st.error(f"Error elaborating on {feature_name}: {e}")
         return None
 
+# Number of features elaborated per request. A single elaborate_feature call
+# gets the whole 8000-token budget, so batches are kept small enough that
+# each feature still has room for a full analysis
+ELABORATE_BATCH_SIZE = 3
+
+# Function to elaborate on one batch of features with a single request. Runs
+# on worker threads, so it must not touch st.* and lets errors propagate
+def request_elaborations(feature_names, feature_sections):
+    features_text = "\n\n---\n\n".join(feature_sections)
+    user_prompt = f"""
+    Please analyze the app reviews below to provide insights into how users perceive each of the listed features. For each feature, your analysis should include:
+
+    - A summary of the general sentiment towards the feature.
+    - Specific examples and direct quotes from the reviews that mention this feature.
+    - An explanation of any common themes or patterns in user feedback regarding this feature.
+    - Any suggestions or requests users have made about this feature.
+
+    Only use the reviews listed under a feature when analyzing that feature. Keep each analysis under 600 words.
+
+    {features_text}
+
+    Report one analysis per feature, using the exact feature names above.
+    """
+    result = create_structured_response(
+        "report_elaborations",
+        "Report the analysis of each feature.",
+        ELABORATIONS_SCHEMA,
+        model="claude-3-5-sonnet-20240620",
+        max_tokens=8000,
+        temperature=0.3,
+        system="You are a data analyst specializing in app reviews.",
+        messages=[{"role": "user", "content": user_prompt}]
+    )
+    # Match the reported names to the ones sent case-insensitively, falling
+    # back to position when the reply covers every feature in order
+    items = result["elaborations"]
+    by_name = {item["feature_name"].strip().lower(): item["analysis"] for item in items}
+    elaborations = {}
+    for position, feature_name in enumerate(feature_names):
+        analysis = by_name.get(feature_name.strip().lower())
+        if analysis is None and len(items) == len(feature_names):
+            analysis = items[position]["analysis"]
+        if analysis is not None:
+            elaborations[feature_name] = analysis
+    return elaborations
+
+# Function to elaborate on several features, ELABORATE_BATCH_SIZE features
+# per request with the batches sent concurrently. Returns a dict of feature
+# name to elaboration; features in a failed batch are left out
+def elaborate_features_batch(feature_names):
+    # Retrieval reads session state, so it stays on the script thread
+    sections = []
+    for feature_name in feature_names:
+        reviews_text = "\n\n".join(retrieve_reviews(feature_name, k=10))
+        sections.append(f'Feature: "{feature_name}"\nApp Reviews:\n{reviews_text}')
+    batches = [range(i, min(i + ELABORATE_BATCH_SIZE, len(feature_names))) for i in range(0, len(feature_names), ELABORATE_BATCH_SIZE)]
+    elaborations = {}
+    with st.spinner(f'Elaborating on {len(feature_names)} features...'):
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            futures = [executor.submit(request_elaborations, [feature_names[i] for i in batch], [sections[i] for i in batch]) for batch in batches]
+            for batch, future in zip(batches, futures):
+                try:
+                    elaborations.update(future.result())
+                except Exception as e:
+                    names = ", ".join(feature_names[i] for i in batch)
+                    st.error(f"Error elaborating on {names}: {e}")
+    return elaborations
+
 # Function to set the current tab and trigger elaboration
 def elaborate_and_set_tab(tab_index, feature_name, notification_placeholder):
     st.session_state.current_tab = tab_index
@@ -187,112 +339,245 @@ def elaborate_and_set_tab(tab_index, feature_name, notification_placeholder):
     st.session_state[f"elaboration_{tab_index}_{feature_name}"] = elaboration
     notification_placeholder.empty()
 
-# Function to generate embeddings and build FAISS index
-def build_faiss_index(reviews):
+# Function to set the current tab and elaborate on every feature in it that
+# hasn't been elaborated yet
+def elaborate_all_and_set_tab(tab_index, feature_names, notification_placeholder):
+    st.session_state.current_tab = tab_index
+    with notification_placeholder:
+        st.info(f'Elaborating on {len(feature_names)} features...')
+    elaborations = elaborate_features_batch(feature_names)
+    missing_names = []
+    for feature_name in feature_names:
+        if feature_name in elaborations:
+            st.session_state[f"elaboration_{tab_index}_{feature_name}"] = elaborations[feature_name]
+        else:
+            missing_names.append(feature_name)
+    if missing_names:
+        st.warning(f"No analysis was returned for: {', '.join(missing_names)}")
+    notification_placeholder.empty()
+
+# Sentence embedding model used for review retrieval. You can choose a different model
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Load the embedding model once per process and share it across reruns and
+# sessions instead of reloading the weights on every analysis
+@st.cache_resource(show_spinner=False)
+def get_embedding_model():
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+# Review count below which the exact IndexFlatL2 is used instead of HNSW
+HNSW_MIN_REVIEWS = 500
+
+# Description of how the FAISS index is built; part of the on-disk cache key,
+# so update it whenever the index construction below changes
+INDEX_CONFIG = f"flat-below-{HNSW_MIN_REVIEWS}/hnsw-sq8-m32-efc40"
+
+# Directory where built FAISS indexes and their embeddings are saved, so
+# analysing the same reviews again (even after a restart) skips encoding
+INDEX_CACHE_DIR = os.path.join(parent_dir, ".cache", "appstore_reviews")
+
+# Function to write a cache file atomically: write_file fills a temp file in
+# the same directory, which then replaces the final path in one step, so a
+# crash or a concurrent writer never leaves a truncated file behind
+def write_cache_file(path, write_file):
+    fd, tmp_path = tempfile.mkstemp(dir=INDEX_CACHE_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        write_file(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+# Function to save the embeddings to an .npy path without np.save appending
+# its own extension to the temp file name
+def save_embeddings(path, embeddings):
+    with open(path, 'wb') as f:
+        np.save(f, embeddings)
+
+# Function to generate embeddings and build the FAISS index for a set of
+# review texts. Cached per process by cache_key (keeping the most recent
+# few) and persisted to disk under the same key; the texts themselves are
+# excluded from Streamlit's hashing. An unreadable cache file is treated as
+# a miss and rebuilt
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_or_build_faiss_index(cache_key, _review_texts):
+    index_path = os.path.join(INDEX_CACHE_DIR, f"{cache_key}.faiss")
+    embeddings_path = os.path.join(INDEX_CACHE_DIR, f"{cache_key}.npy")
+    try:
+        return faiss.read_index(index_path), np.load(embeddings_path)
+    except Exception:
+        pass
+
+    # Generate embeddings
+    embeddings = get_embedding_model().encode(_review_texts, batch_size=64, convert_to_numpy=True, show_progress_bar=False)
+    # Build FAISS index. HNSW gives approximate graph search, which is much
+    # faster per query than a brute-force scan, and 8-bit scalar
+    # quantization stores each vector in a quarter of the space; for small
+    # review sets the graph build isn't worth it, so keep the exact flat
+    # index there
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    dimension = embeddings.shape[1]
+    if len(embeddings) < HNSW_MIN_REVIEWS:
+        index = faiss.IndexFlatL2(dimension)
+    else:
+        index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, 32)
+        index.hnsw.efConstruction = 40
+        # The quantizer needs per-dimension value ranges before adding
+        index.train(embeddings)
+    index.add(embeddings)
+
+    # The disk copy is only a cache, so a failed write doesn't fail the build
+    try:
+        os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+        write_cache_file(index_path, lambda path: faiss.write_index(index, path))
+        write_cache_file(embeddings_path, lambda path: save_embeddings(path, embeddings))
+    except Exception as e:
+        logging.warning(f"Could not cache FAISS index to {INDEX_CACHE_DIR}: {e}")
+    return index, embeddings
+
+# Function to generate embeddings and build FAISS index. The cache key hashes
+# the embedding model, the index config and the review texts themselves, so
+# a changed review set or index setup never reuses a stale index. Files in
+# INDEX_CACHE_DIR are never evicted
+def build_faiss_index(review_texts):
     with st.spinner('Generating embeddings and building FAISS index...'):
-        # Initialize the embedding model
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')  # You can choose a different model
-        st.session_state.embedding_model = embedding_model
-        # Prepare review texts
-        review_texts = []
-        for i, review in enumerate(reviews):
-            content = review.get('translated_content') or review.get('content', '')
-            review_texts.append(content)
-        # Generate embeddings
-        embeddings = embedding_model.encode(review_texts, show_progress_bar=False)
+        key_parts = [EMBEDDING_MODEL_NAME, INDEX_CONFIG, *review_texts]
+        cache_key = hashlib.sha1("\0".join(key_parts).encode()).hexdigest()
+        index, embeddings = load_or_build_faiss_index(cache_key, review_texts)
         st.session_state.review_embeddings = embeddings
-        # Build FAISS index
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(np.array(embeddings))
         st.session_state.faiss_index = index
-        st.session_state.review_texts = review_texts
 
 # Function to retrieve relevant reviews using FAISS
 def retrieve_reviews(query, k=5):
     # Generate embedding for the query
-    query_embedding = st.session_state.embedding_model.encode([query])
+    query_embedding = get_embedding_model().encode([query])
     # Search in the FAISS index
-    distances, indices = st.session_state.faiss_index.search(np.array(query_embedding), k)
+    # The index is shared across sessions, so efSearch is passed per query
+    # instead of being set on the index
+    index = st.session_state.faiss_index
+    params = faiss.SearchParametersHNSW(efSearch=max(16, k)) if isinstance(index, faiss.IndexHNSW) else None
+    distances, indices = index.search(np.ascontiguousarray(query_embedding, dtype=np.float32), k, params=params)
     indices = indices.flatten()
-    # Retrieve the corresponding reviews
-    retrieved_reviews = [st.session_state.review_texts[idx] for idx in indices]
+    # Retrieve the corresponding reviews (FAISS pads missing hits with -1)
+    retrieved_reviews = [st.session_state.review_texts[idx] for idx in indices if idx >= 0]
     return retrieved_reviews
 
-# Function to analyze reviews using retrieved summaries
+# Function to summarize a single chunk of reviews. Runs inside the event loop
+# started by analyze_reviews, so it must not touch st.* and lets errors
+# propagate to the caller
+async def summarize_review_chunk(client, semaphore, chunk_reviews):
+    reviews_text = "\n\n".join(chunk_reviews)
+    user_prompt = f"""
+    Summarize the key features mentioned in the following app reviews for Facetune. Identify features that are most loved and least loved by users, and provide a brief description for each.
+
+    App Reviews:
+    {reviews_text}
+
+    Report the most loved and least loved features, with a short description and the number of reviews mentioning each.
+    """
+    async with semaphore:
+        result = await acreate_structured_response(
+            client,
+            "report_analysis",
+            "Report the most loved and least loved features.",
+            AnalysisResult.model_json_schema(),
+            model="claude-3-5-sonnet-20240620",
+            max_tokens=4000,
+            temperature=0.5,
+            system="You are a data analyst specializing in app reviews.",
+            messages=[{"role": "user", "content": user_prompt}]
+        )
+    return AnalysisResult(**result)
+
+# Function to summarize all chunks concurrently. The async client is created
+# per run because its connection pool is bound to the event loop that
+# asyncio.run creates here
+async def summarize_review_chunks(chunks):
+    semaphore = asyncio.Semaphore(SUMMARY_WORKERS)
+    async with AsyncAnthropic(api_key=anthropic_api_key) as client:
+        return await asyncio.gather(
+            *(summarize_review_chunk(client, semaphore, chunk) for chunk in chunks),
+            return_exceptions=True
+        )
+
+# Number of chunk summaries requested from Claude at the same time
+SUMMARY_WORKERS = 10
+
+# Number of features kept per list after merging chunk results, and the
+# minimum number of merged features below which Claude consolidates instead
+MAX_FEATURES_PER_LIST = 10
+MIN_MERGED_FEATURES = 3
+
+# Function to merge per-chunk feature lists by case-insensitive name, summing
+# mentions and keeping the longest description
+def merge_features(feature_lists):
+    merged = {}
+    for features in feature_lists:
+        for feature in features:
+            key = feature.feature_name.strip().lower()
+            if key not in merged:
+                merged[key] = feature.model_copy()
+                continue
+            existing = merged[key]
+            existing.mentions += feature.mentions
+            if len(feature.description) > len(existing.description):
+                existing.description = feature.description
+    return sorted(merged.values(), key=lambda f: f.mentions, reverse=True)[:MAX_FEATURES_PER_LIST]
+
+# Function to analyze reviews using retrieved summaries. Chunks are
+# summarized concurrently; a failed chunk is skipped with a warning instead
+# of aborting the whole analysis. Chunk results are merged in Python, and
+# Claude is only asked to consolidate when the merge yields too few features
 def analyze_reviews():
     with st.spinner('Analyzing reviews...'):
         chunk_size = 50
+        review_texts = st.session_state.review_texts
+        chunks = [review_texts[i:i+chunk_size] for i in range(0, len(review_texts), chunk_size)]
         summaries = []
-        for i in range(0, len(st.session_state.review_texts), chunk_size):
-            chunk_reviews = st.session_state.review_texts[i:i+chunk_size]
-            reviews_text = "\n\n".join(chunk_reviews)
-            user_prompt = f"""
-            Summarize the key features mentioned in the following app reviews for Facetune. Identify features that are most loved and least loved by users, and provide a brief description for each.
-
-            App Reviews:
-            {reviews_text}
-
-            Your response should be a JSON object with "most_loved" and "least_loved" keys, each containing a list of features with their descriptions.
-            """
-            try:
-                response = anthropic.messages.create(
-                    model="claude-3-5-sonnet-20240620",
-                    max_tokens=4000,
-                    temperature=0.5,
-                    system="You are a data analyst specializing in app reviews.",
-                    messages=[{"role": "user", "content": user_prompt}]
-                )
-                summary = response.content[0].text.strip()
-                summaries.append(summary)
-            except Exception as e:
-                st.error(f"Error summarizing reviews: {e}")
-                return None
-
-        combined_summaries = "\n\n".join(summaries)
+        # gather returns results in chunk order
+        for i, result in enumerate(asyncio.run(summarize_review_chunks(chunks))):
+            if isinstance(result, Exception):
+                st.warning(f"Skipping review chunk {i + 1} of {len(chunks)}: {result}")
+            else:
+                summaries.append(result)
+        if not summaries:
+            st.error("Error summarizing reviews: every chunk failed.")
+            return None
+
+        merged_result = AnalysisResult(
+            most_loved=merge_features(summary.most_loved for summary in summaries),
+            least_loved=merge_features(summary.least_loved for summary in summaries)
+        )
+        if len(merged_result.most_loved) + len(merged_result.least_loved) >= MIN_MERGED_FEATURES:
+            st.session_state.analysis_result = merged_result
+            return
+
+        combined_summaries = "\n\n".join(summary.model_dump_json() for summary in summaries)
         final_prompt = f"""
         Based on the following summaries, provide a consolidated analysis of the most loved and least loved features for the Facetune app.
 
         Summaries:
         {combined_summaries}
 
-        Your response MUST be a valid JSON object with the following structure:
-        {{
-            "most_loved": [
-                {{"feature_name": "Feature 1", "description": "Description 1", "mentions": 10}},
-                {{"feature_name": "Feature 2", "description": "Description 2", "mentions": 8}}
-            ],
-            "least_loved": [
-                {{"feature_name": "Feature 3", "description": "Description 3", "mentions": 5}},
-                {{"feature_name": "Feature 4", "description": "Description 4", "mentions": 3}}
-            ]
-        }}
-        Ensure that the JSON is properly formatted and contains only the required information.
+        Report the most loved and least loved features, with a short description and the number of mentions for each.
         """
         try:
-            response = anthropic.messages.create(
+            analysis_result = create_structured_response(
+                "report_analysis",
+                "Report the consolidated most loved and least loved features.",
+                AnalysisResult.model_json_schema(),
                 model="claude-3-5-sonnet-20240620",
                 max_tokens=2000,
                 temperature=0.5,
-                system="You are a data analyst specializing in app reviews. Always respond with valid JSON.",
+                system="You are a data analyst specializing in app reviews.",
                 messages=[{"role": "user", "content": final_prompt}]
             )
-            response_text = response.content[0].text.strip()
-            
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                analysis_result = json.loads(json_str)
-            else:
-                raise ValueError("No valid JSON found in the response")
 
             # Validate and store the result
             st.session_state.analysis_result = AnalysisResult(**analysis_result)
         except Exception as e:
             st.error(f"Error in final analysis: {e}")
-            st.error("Raw response from AI:")
-            st.text(response_text)
             return None
 
 # Get date range from user
@@ -329,21 +614,36 @@ if st.button("Analyze Reviews"):
     to_date_str = to_date.strftime("%Y-%m-%d")
     
     with st.spinner('Fetching and processing reviews...'):
-        st.session_state.reviews = get_all_reviews(ext_id, from_date_str, to_date_str, max_reviews=2500)
+        try:
+            st.session_state.reviews = get_all_reviews(ext_id, from_date_str, to_date_str, max_reviews=2500)
+        except requests.HTTPError as e:
+            st.error(f"Error fetching reviews: {e}")
+            st.session_state.reviews = None
     
+    st.session_state.review_downloads = None
     if st.session_state.reviews:
-        # Create download links
-        st.markdown(get_download_link(st.session_state.reviews, "facetune_reviews.json", "📄 Download JSON"), unsafe_allow_html=True)
+        # Serialize the downloads once per fetch; later reruns render the
+        # buttons from these bytes
+        st.session_state.review_downloads = (
+            json.dumps(st.session_state.reviews, indent=2).encode(),
+            pd.DataFrame(st.session_state.reviews).to_csv(index=False).encode()
+        )
         
-        # Convert to DataFrame for CSV download
-        df = pd.DataFrame(st.session_state.reviews)
-        st.markdown(get_download_link(df, "facetune_reviews.csv", "📄 Download CSV"), unsafe_allow_html=True)
+        # Extract the review texts once; they feed both the index and the
+        # analysis. Empty and duplicate texts (repeat posts, spam) are dropped
+        # so they aren't embedded or sent to Claude twice; dict.fromkeys keeps
+        # the original order
+        texts = ((r.get('translated_content') or r.get('content') or '').strip() for r in st.session_state.reviews)
+        st.session_state.review_texts = list(dict.fromkeys(text for text in texts if text))
         
-        # Build FAISS index
-        build_faiss_index(st.session_state.reviews)
-        
-        # Analyze reviews
-        analyze_reviews()
+        if st.session_state.review_texts:
+            # Build FAISS index
+            build_faiss_index(st.session_state.review_texts)
+            
+            # Analyze reviews
+            analyze_reviews()
+        else:
+            st.error("None of the fetched reviews have any text to analyze.")
 
         # Removed the success message:
         # if st.session_state.analysis_result:
@@ -351,6 +651,13 @@ if st.button("Analyze Reviews"):
     else:
         st.error("No reviews found for the selected date range. Please check the API response above for more details.")
 
+# Download buttons live outside the "Analyze Reviews" block so they survive
+# the rerun that clicking one of them triggers
+if st.session_state.review_downloads:
+    json_bytes, csv_bytes = st.session_state.review_downloads
+    st.download_button("📄 Download JSON", data=json_bytes, file_name="facetune_reviews.json", mime="application/json")
+    st.download_button("📄 Download CSV", data=csv_bytes, file_name="facetune_reviews.csv", mime="text/csv")
+
 # Display results
 if st.session_state.analysis_result and st.session_state.review_texts:
     st.header("App Review Analysis Results")
@@ -361,6 +668,11 @@ if st.session_state.analysis_result and st.session_state.review_texts:
         # Sort features by mentions in descending order
         sorted_features = sorted(features, key=lambda x: x.mentions, reverse=True)
         
+        pending_names = [f.feature_name for f in sorted_features if f"elaboration_{tab_index}_{f.feature_name}" not in st.session_state]
+        if pending_names:
+            all_notification_placeholder = tab.empty()
+            tab.button('Elaborate all features', key=f"elaborate_all_{tab_index}", on_click=elaborate_all_and_set_tab, args=(tab_index, pending_names, all_notification_placeholder))
+        
         for i, feature in enumerate(sorted_features):
             tab.subheader(feature.feature_name)
             tab.write(f"**Description:** {feature.description}")
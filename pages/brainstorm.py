@@ -1,6 +1,5 @@
 import os
 import sys
-import toml
 import streamlit as st
 from openai import OpenAI
 from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
@@ -12,15 +11,27 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
+from pages.utils.secrets_loader import load_secrets
+
+# Create API clients once per process so their connection pools are reused
+# across reruns instead of being rebuilt on every interaction
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key):
+    return OpenAI(api_key=api_key)
+
+@st.cache_resource(show_spinner=False)
+def get_anthropic_client(api_key):
+    return Anthropic(api_key=api_key)
+
 # Get the API key from Streamlit secrets
 secrets_path = os.path.join(parent_dir, ".streamlit", "secrets.toml")
-secrets = toml.load(secrets_path)
+secrets = load_secrets(secrets_path)
 os.environ["OPENAI_API_KEY"] = secrets.get("OPENAI_API_KEY", "")
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+client = get_openai_client(os.environ["OPENAI_API_KEY"])
 
 # Add Anthropic client initialization
 anthropic_api_key = secrets.get("ANTHROPIC_API_KEY", "")
-anthropic = Anthropic(api_key=anthropic_api_key)
+anthropic = get_anthropic_client(anthropic_api_key)
 
 # Add this near the top of the file, after the imports
 FACETUNE_TOV = """Facetune tone of voice:
@@ -60,32 +71,41 @@ class MarketingIdea(BaseModel):
     idea_title: str
     idea_content: str
 
-def compare_summaries(liked_summary, rejected_summary):
-    system_prompt = """You are a strategic marketing expert. Your task is to compare two summary lists: one of liked ideas and one of rejected ideas. Analyze these lists and create a concise comparison that highlights:
+class IdeaSummaries(BaseModel):
+    liked_summary: str
+    rejected_summary: str
+    comparison: str
 
-    1. Ideas the user likes and wants to pursue
-    2. Ideas the user doesn't like and wants to avoid
+# Summarize liked and rejected ideas and compare them in a single request.
+# Like the other LLM helpers below it is cached on its inputs, so a
+# Like/Reject click only pays for calls whose inputs actually changed
+@st.cache_data(show_spinner=False)
+def summarize_and_compare(liked_ideas, rejected_ideas):
+    liked_text = "\n".join(f"{title}: {content}" for title, content in liked_ideas) or "No liked ideas yet."
+    rejected_text = "\n".join(f"{title}: {content}" for title, content in rejected_ideas) or "No rejected ideas yet."
 
-    Focus on the key differences between the two lists. Ignore any similarities and concentrate on unique aspects of each. Your output should be in this format:
+    system_prompt = """You are a strategic marketing expert. You will receive two lists of brainstorming ideas: liked ideas and rejected ideas.
 
-    Be concise and specific in your analysis, and write a list of Things to avoid and Things to pursue.
-    Do not write any system prompts/introduction/instructions/conclusion, just output the comparison."""
+    1. Summarize each list, identifying recurring themes, concepts and patterns. Disregard any details about seasonality and holidays; the summaries should be as dry as possible and only outline the campaign actions. Limit each summary to 250 words.
+    2. Compare the two summaries and create a concise comparison that highlights ideas the user likes and wants to pursue, and ideas the user doesn't like and wants to avoid. Focus on the key differences and ignore similarities. Write it as a list of Things to avoid and Things to pursue.
 
-    response = client.chat.completions.create(
+    Write each field as plain text. Do not write any introduction or conclusion."""
+
+    completion = client.beta.chat.completions.parse(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Liked ideas summary:\n{liked_summary}\n\nRejected ideas summary:\n{rejected_summary}"}
+            {"role": "user", "content": f"Liked ideas:\n{liked_text}\n\nRejected ideas:\n{rejected_text}"}
         ],
+        response_format=IdeaSummaries,
         temperature=0.3
     )
-    comparison = response.choices[0].message.content.strip()
-    return comparison
+    result = completion.choices[0].message.parsed
+    if result is None:
+        raise ValueError(completion.choices[0].message.refusal or "No summaries in the response")
+    return result.liked_summary, result.rejected_summary, result.comparison
 
-def generate_marketing_idea(topic, liked_summary, rejected_summary):
-    # First, compare the summaries
-    comparison = compare_summaries(liked_summary, rejected_summary)
-    
+def generate_marketing_idea(topic, comparison):
     system_prompt = f"""You are a marketing expert for the Facetune brand, in charge of generating creative marketing ideas.
     
     {FACETUNE_TOV}
@@ -115,12 +135,17 @@ def generate_marketing_idea(topic, liked_summary, rejected_summary):
     
     return completion.choices[0].message.parsed
 
+# Build the hashable cache key summarize_ideas takes from MarketingIdea objects
+def ideas_key(ideas):
+    return tuple((idea.idea_title, idea.idea_content) for idea in ideas)
+
+@st.cache_data(show_spinner=False)
 def summarize_ideas(ideas, idea_type):
     if not ideas:
         return f"No {idea_type} ideas to summarize."
     
-    # Convert MarketingIdea objects to strings
-    idea_strings = [f"{idea.idea_title}: {idea.idea_content}" for idea in ideas]
+    # Convert (title, content) pairs to strings
+    idea_strings = [f"{title}: {content}" for title, content in ideas]
     
     system_prompt = f"""You are a marketing strategist. Summarize the following {idea_type} brainstorming ideas, identify any recurring themes, concepts and patterns. You must disregard any details about seasonality and holidays as I want the summary to be as dry as possible and only outline the campaign actions. Do not write any system prompts/introduction/instructions/conclusion, just output the idea. You are limited to 250 words."""
     response = client.chat.completions.create(
@@ -134,23 +159,28 @@ def summarize_ideas(ideas, idea_type):
     summary = response.choices[0].message.content.strip()
     return summary
 
+# Errors raise out of the cached helper so a failed expansion is retried
+# next time instead of being cached
+@st.cache_data(show_spinner=False)
+def fetch_expanded_topic(topic):
+    response = anthropic.messages.create(
+        model="claude-3-5-sonnet-20240620",
+        max_tokens=1000,
+        temperature=0.8,
+        system="You are a marketing expert for Facetune.",
+        messages=[
+            {"role": "user", "content": f"Read the following Facetune tone of voice guidelines:\n\n{FACETUNE_TOV}\n\nNow, create a unique system prompt that expands on the user's input topic '{topic}' while keeping its exact meaning. The expanded topic should be suitable for generating marketing ideas for Facetune. Your response should be concise and directly usable as a system prompt for further idea generation. Do not write any system prompts/introduction/instructions/conclusion, just output the idea. You are limited to 25 words."}
+        ]
+    )
+    return response.content[0].text
+
 def expand_topic(topic):
     if not st.session_state.use_topic_expansion:
         return topic
     
     try:
         with st.spinner(f'Expanding on "{topic}"...'):
-            response = anthropic.messages.create(
-                model="claude-3-5-sonnet-20240620",
-                max_tokens=1000,
-                temperature=0.8,
-                system="You are a marketing expert for Facetune.",
-                messages=[
-                    {"role": "user", "content": f"Read the following Facetune tone of voice guidelines:\n\n{FACETUNE_TOV}\n\nNow, create a unique system prompt that expands on the user's input topic '{topic}' while keeping its exact meaning. The expanded topic should be suitable for generating marketing ideas for Facetune. Your response should be concise and directly usable as a system prompt for further idea generation. Do not write any system prompts/introduction/instructions/conclusion, just output the idea. You are limited to 25 words."}
-                ]
-            )
-            expanded_topic = response.content[0].text
-            return expanded_topic
+            return fetch_expanded_topic(topic)
     except Exception as e:
         st.error(f"Error expanding topic: {e}")
         return topic
@@ -159,15 +189,25 @@ def process_idea_and_generate_new():
     if not st.session_state.expanded_topic:
         st.session_state.expanded_topic = expand_topic(st.session_state.topic)
     
-    with st.spinner("Summarizing ideas..."):
-        liked_summary = summarize_ideas(st.session_state.liked_ideas, "liked")
-        rejected_summary = summarize_ideas(st.session_state.rejected_ideas, "rejected")
-    
-    with st.spinner("Comparing summaries..."):
-        comparison = compare_summaries(liked_summary, rejected_summary)
+    liked_key = ideas_key(st.session_state.liked_ideas)
+    rejected_key = ideas_key(st.session_state.rejected_ideas)
+    try:
+        with st.spinner("Summarizing and comparing ideas..."):
+            liked_summary, rejected_summary, comparison = summarize_and_compare(liked_key, rejected_key)
+    except Exception as e:
+        # Fall back to the separate summaries and let the idea generator work
+        # from them directly
+        st.error(f"Error summarizing ideas: {e}")
+        with st.spinner("Summarizing ideas..."):
+            liked_summary = summarize_ideas(liked_key, "liked")
+            rejected_summary = summarize_ideas(rejected_key, "rejected")
+        comparison = f"Things to pursue:\n{liked_summary}\n\nThings to avoid:\n{rejected_summary}"
+    # Keep the summaries, with the ideas they describe, for the "Summary of
+    # Your Ideas" section so it doesn't request them again
+    st.session_state.idea_summaries = (liked_key, rejected_key, liked_summary, rejected_summary)
     
     with st.spinner("Generating a new marketing concept..."):
-        st.session_state.current_idea = generate_marketing_idea(st.session_state.expanded_topic, liked_summary, rejected_summary)
+        st.session_state.current_idea = generate_marketing_idea(st.session_state.expanded_topic, comparison)
     
     st.rerun()
 
@@ -187,6 +227,8 @@ if 'expanded_topic' not in st.session_state:
     st.session_state.expanded_topic = None
 if 'use_topic_expansion' not in st.session_state:
     st.session_state.use_topic_expansion = True
+if 'idea_summaries' not in st.session_state:
+    st.session_state.idea_summaries = None
 
 st.title("💡 Brainstorm App")
 st.write("Welcome! Input a topic to start generating marketing ideas.")
@@ -248,9 +290,14 @@ with col2:
         st.write("No rejected ideas yet.")
 
 if st.session_state.current_idea is None and st.session_state.topic and (st.session_state.liked_ideas or st.session_state.rejected_ideas):
-    with st.spinner("Summarizing your liked and rejected ideas..."):
-        liked_summary = summarize_ideas(st.session_state.liked_ideas, "liked")
-        rejected_summary = summarize_ideas(st.session_state.rejected_ideas, "rejected")
+    liked_key = ideas_key(st.session_state.liked_ideas)
+    rejected_key = ideas_key(st.session_state.rejected_ideas)
+    if st.session_state.idea_summaries and st.session_state.idea_summaries[:2] == (liked_key, rejected_key):
+        liked_summary, rejected_summary = st.session_state.idea_summaries[2:]
+    else:
+        with st.spinner("Summarizing your liked and rejected ideas..."):
+            liked_summary = summarize_ideas(liked_key, "liked")
+            rejected_summary = summarize_ideas(rejected_key, "rejected")
     st.subheader("Summary of Your Ideas")
     if st.session_state.liked_ideas:
         with st.expander("Liked Ideas Summary", expanded=False):
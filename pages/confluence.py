@@ -1,14 +1,22 @@
 import streamlit as st
 import os
+import sys
 import requests
 import json
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from bs4 import BeautifulSoup
 from io import BytesIO
-import toml
 import traceback  # Add this import
 from difflib import get_close_matches  # Add this import
 
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from pages.utils.secrets_loader import load_secrets
+
 # Set page configuration
 st.set_page_config(
     page_title="🔗 Campaign Image Finder",
@@ -21,8 +29,7 @@ st.title("🔗 Campaign Image Finder")
 
 # Load secrets
 secrets_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".streamlit", "secrets.toml")
-with open(secrets_path, "r") as f:
-    secrets = toml.load(f)
+secrets = load_secrets(secrets_path)
 
 ATLASSIAN_API_TOKEN = secrets.get('ATLASSIAN_API_TOKEN')
 ATLASSIAN_EMAIL = secrets.get('ATLASSIAN_EMAIL')
@@ -45,6 +52,16 @@ OPENAI_HEADERS = {
     'Authorization': f'Bearer {OPENAI_API_KEY}'
 }
 
+# Reuse one HTTP session for all Atlassian and OpenAI calls so connections
+# are kept alive across requests and reruns instead of reconnecting each time
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+http_session = get_http_session()
+
 def check_secrets():
     required_secrets = [
         'ATLASSIAN_API_TOKEN',
@@ -58,6 +75,14 @@ def check_secrets():
         st.error(f"Missing required secrets: {', '.join(missing_secrets)}")
         st.stop()
 
+# Confluence structure changes rarely, so cache lookups for a few minutes to
+# avoid re-fetching the same pages on every search; errors are not cached
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_confluence_json(url, params=None):
+    response = http_session.get(url, headers=ATLASSIAN_HEADERS, auth=auth, params=params)
+    response.raise_for_status()
+    return response.json()
+
 def get_space_id(space_key_or_id):
     if not space_key_or_id:
         st.error("REVENUE_SPACE_KEY_OR_ID is not set. Please check your secrets.")
@@ -68,18 +93,17 @@ def get_space_id(space_key_or_id):
     else:
         url = f"{ATLASSIAN_BASE_URL}/wiki/api/v2/spaces"
         params = {'keys': space_key_or_id}
-        response = requests.get(url, headers=ATLASSIAN_HEADERS, auth=auth, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            spaces = data.get('results', [])
-            if spaces:
-                return spaces[0].get('id')
-            else:
-                st.error(f"No spaces found with key: {space_key_or_id}")
-                return None
-        else:
+        try:
+            data = fetch_confluence_json(url, params)
+        except requests.HTTPError:
             st.error(f"Failed to fetch spaces. Please check your Confluence settings.")
             return None
+        spaces = data.get('results', [])
+        if spaces:
+            return spaces[0].get('id')
+        else:
+            st.error(f"No spaces found with key: {space_key_or_id}")
+            return None
 
 def get_content_id_by_title(space_id, title):
     url = f"{ATLASSIAN_BASE_URL}/wiki/rest/api/content"
@@ -89,31 +113,32 @@ def get_content_id_by_title(space_id, title):
         "expand": "version",
         "limit": 1
     }
-    response = requests.get(url, headers=ATLASSIAN_HEADERS, auth=auth, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        results = data.get('results', [])
-        if results:
-            return results[0].get('id')
-        else:
-            st.error(f"No content found with title: {title}")
-            return None
-    else:
+    try:
+        data = fetch_confluence_json(url, params)
+    except requests.HTTPError:
         st.error(f"Failed to fetch content. Please check your Confluence settings.")
         return None
+    results = data.get('results', [])
+    if results:
+        return results[0].get('id')
+    else:
+        st.error(f"No content found with title: {title}")
+        return None
 
 def get_child_pages(content_id):
     url = f"{ATLASSIAN_BASE_URL}/wiki/rest/api/content/{content_id}/child/page"
-    response = requests.get(url, headers=ATLASSIAN_HEADERS, auth=auth)
-    if response.status_code == 200:
-        data = response.json()
-        pages = data.get('results', [])
-        return [{'title': page.get('title'), 'id': page.get('id')} for page in pages]
-    else:
+    try:
+        data = fetch_confluence_json(url)
+    except requests.HTTPError:
         st.error(f"Failed to fetch child pages. Please check your Confluence settings.")
         return []
+    pages = data.get('results', [])
+    return [{'title': page.get('title'), 'id': page.get('id')} for page in pages]
 
-def ask_gpt(prompt):
+# Completions use temperature 0, so the same prompt can be answered from the
+# cache; failed requests raise and are therefore never cached
+@st.cache_data(show_spinner=False)
+def fetch_gpt_completion(prompt):
     url = "https://api.openai.com/v1/chat/completions"
     payload = {
         "model": "gpt-4",
@@ -122,27 +147,29 @@ def ask_gpt(prompt):
         ],
         "temperature": 0
     }
-    response = requests.post(url, headers=OPENAI_HEADERS, json=payload)
-    if response.status_code == 200:
-        data = response.json()
-        return data['choices'][0]['message']['content'].strip()
-    else:
+    response = http_session.post(url, headers=OPENAI_HEADERS, json=payload)
+    response.raise_for_status()
+    data = response.json()
+    return data['choices'][0]['message']['content'].strip()
+
+def ask_gpt(prompt):
+    try:
+        return fetch_gpt_completion(prompt)
+    except requests.HTTPError:
         st.error(f"Failed to get response from GPT. Please check your OpenAI settings.")
         return None
 
 def get_page_content(page_id):
     url = f"{ATLASSIAN_BASE_URL}/wiki/rest/api/content/{page_id}"
     params = {'expand': 'body.storage'}
-    response = requests.get(url, headers=ATLASSIAN_HEADERS, auth=auth, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    else:
-        st.error(f"Failed to fetch page content. Status Code: {response.status_code}, Response: {response.text}")
+    try:
+        return fetch_confluence_json(url, params)
+    except requests.HTTPError as e:
+        st.error(f"Failed to fetch page content. Status Code: {e.response.status_code}, Response: {e.response.text}")
         return None
 
 def download_image(url):
-    response = requests.get(url, headers=ATLASSIAN_HEADERS, auth=auth)
+    response = http_session.get(url, headers=ATLASSIAN_HEADERS, auth=auth)
     if response.status_code == 200:
         return response.content
     else:
@@ -155,7 +182,7 @@ def find_closest_matches(suggestions, options, n=1):
         matches = get_close_matches(suggestion, options, n=n, cutoff=0.6)
         if matches:
             closest_matches.extend(matches)
-    return list(set(closest_matches))  # Remove duplicates
+    return list(dict.fromkeys(closest_matches))  # Remove duplicates, keeping GPT's order
 
 def main():
     # Check that all secrets are set
@@ -274,8 +301,9 @@ def main():
                         st.stop()
 
                     # Step 8: Find the rows corresponding to the selected brands
+                    selected_brands_set = set(selected_brands_list)
                     selected_rows = [
-                        row for row in rows_data if row['brand'] in selected_brands_list
+                        row for row in rows_data if row['brand'] in selected_brands_set
                     ]
                     if not selected_rows:
                         st.error(f"Could not find data for selected brands.")
@@ -4,7 +4,6 @@ import sys
 import replicate
 import requests
 import base64
-import toml
 import io
 import zipfile
 from concurrent.futures import ThreadPoolExecutor
@@ -17,6 +16,7 @@ sys.path.append(parent_dir)
 
 # Now import the workflow module
 from pages.utils.upscale_workflow import get_workflow_json  # Change this line
+from pages.utils.secrets_loader import load_secrets
 
 # Set page configuration
 st.set_page_config(
@@ -29,8 +29,7 @@ st.title("🎨 Flux Pro 1.1")
 
 # Get the API key from Streamlit secrets
 secrets_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.streamlit', 'secrets.toml')
-with open(secrets_path, 'r') as f:
-    secrets = toml.load(f)
+secrets = load_secrets(secrets_path)
 api_key = secrets["REPLICATE_API_TOKEN"]
 os.environ["REPLICATE_API_TOKEN"] = api_key
 
@@ -197,12 +196,21 @@ if st.button("🎨 Generate Images"):
                 st.success("Image generation complete!")
                 st.session_state.generated_image_urls = outputs
 
-                # Store the generated image data for download
-                st.session_state.generated_image_data = []
-                for image_url in outputs:
+                # Function to download a single generated image
+                def download_generated_image(image_url):
                     response = requests.get(image_url)
                     if response.status_code == 200:
-                        img_data = response.content
+                        return response.content
+                    return None
+
+                # Download all generated images concurrently
+                with ThreadPoolExecutor() as executor:
+                    downloaded_images = list(executor.map(download_generated_image, outputs))
+
+                # Store the generated image data for download
+                st.session_state.generated_image_data = []
+                for image_url, img_data in zip(outputs, downloaded_images):
+                    if img_data is not None:
                         st.session_state.generated_image_data.append(img_data)
                     else:
                         st.error(f"Failed to retrieve the generated image at {image_url}.")
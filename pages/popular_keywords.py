@@ -3,13 +3,14 @@ import sys
 import requests
 import pandas as pd
 import streamlit as st
-import toml
 
 # Add parent directory to sys.path (if needed)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
+from pages.utils.secrets_loader import load_secrets
+
 # Set page configuration
 st.set_page_config(
     page_title="ASO Keyword Recommendations",
@@ -29,8 +30,7 @@ secrets_path = os.path.join(
 )
 
 try:
-    with open(secrets_path, "r") as f:
-        secrets = toml.load(f)
+    secrets = load_secrets(secrets_path)
     api_token = secrets["APPFOLLOW_API_TOKEN"]
 except FileNotFoundError:
     st.error(f"Secrets file not found at {secrets_path}")
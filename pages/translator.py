@@ -1,6 +1,5 @@
 import streamlit as st
 from streamlit_tags import st_tags
-import toml
 from anthropic import Anthropic
 import os
 import sys
@@ -8,13 +7,19 @@ import sys
 # Add utils folder to sys.path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
 from translator_prompt import PROMPTS
+from secrets_loader import load_secrets
 
 # Load API key from secrets.toml
-secrets = toml.load(os.path.join(os.path.dirname(__file__), '..', '.streamlit', 'secrets.toml'))
+secrets = load_secrets(os.path.join(os.path.dirname(__file__), '..', '.streamlit', 'secrets.toml'))
 anthropic_api_key = secrets['ANTHROPIC_API_KEY']
 
-# Initialize Anthropic client
-anthropic = Anthropic(api_key=anthropic_api_key)
+# Initialize Anthropic client once per process so its connection pool is
+# reused across reruns
+@st.cache_resource(show_spinner=False)
+def get_anthropic_client(api_key):
+    return Anthropic(api_key=api_key)
+
+anthropic = get_anthropic_client(anthropic_api_key)
 
 # Streamlit app configuration
 st.set_page_config(page_title="Copy Translator", page_icon="🌐", layout="wide")
@@ -63,7 +68,9 @@ if st.button("Translate"):
             # Call the Claude API using the Messages API
             with st.spinner('Translating...'):  # Add this line
                 try:
-                    response = anthropic.messages.create(
+                    st.subheader("Translated Content:")
+                    # Stream the translation so text shows up as it is generated
+                    with anthropic.messages.stream(
                         model="claude-3-sonnet-20240229",
                         max_tokens=4000,
                         temperature=0.7,
@@ -71,9 +78,7 @@ if st.button("Translate"):
                         messages=[
                             {"role": "user", "content": prompt}
                         ]
-                    )
-                    translated_text = response.content[0].text.strip()
-                    st.subheader("Translated Content:")
-                    st.write(translated_text)
+                    ) as stream:
+                        st.write_stream(stream.text_stream)
                 except Exception as e:
                     st.error(f"An error occurred during translation: {e}")
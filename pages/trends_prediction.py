@@ -8,13 +8,22 @@ import csv
 import aiohttp
 import asyncio
 import logging
+import queue
+import threading
 from datetime import datetime, timedelta
 import sys
 import subprocess
-import toml
 import pandas as pd
 from serpapi.google_search import GoogleSearch
 from bs4 import BeautifulSoup
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from pages.utils.secrets_loader import load_secrets
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -40,8 +49,7 @@ st.markdown(
 
 # Get API keys from Streamlit secrets
 secrets_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.streamlit', 'secrets.toml')
-with open(secrets_path, 'r') as f:
-    secrets = toml.load(f)
+secrets = load_secrets(secrets_path)
 serpapi_key = secrets.get("SERPAPI_KEY")
 openai_key = secrets.get("OPENAI_API_KEY")
 
@@ -50,6 +58,14 @@ if not serpapi_key or not openai_key:
     st.error("API keys for SerpApi and OpenAI are required. Please add them to your Streamlit secrets.")
     st.stop()
 
+# Keep a single event loop running in the background so each analysis run
+# reuses it instead of creating and tearing down a new loop
+@st.cache_resource
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
 # Initialize session state
 if 'trends_list' not in st.session_state:
     st.session_state['trends_list'] = []
@@ -79,14 +95,16 @@ geo_location = st.sidebar.selectbox(
     help="Select the geographical location for the trends data.",
 )
 
+today = datetime.now()
+
 if date_option == "Custom Range":
-    start_date = st.sidebar.date_input("Start Date", datetime.now() - timedelta(days=7))
-    end_date = st.sidebar.date_input("End Date", datetime.now())
+    start_date = st.sidebar.date_input("Start Date", today - timedelta(days=7))
+    end_date = st.sidebar.date_input("End Date", today)
     if start_date > end_date:
         st.sidebar.error("Start date must be before end date.")
         st.stop()
 else:
-    end_date = datetime.now()
+    end_date = today
     if date_option == "Last 4 days":
         start_date = end_date - timedelta(days=4)
     elif date_option == "Last 7 days":
@@ -107,6 +125,12 @@ geo_location_map = {
 }
 geo_code = geo_location_map.get(geo_location, "US")
 
+# Maximum number of trends summarized concurrently
+max_concurrent_trends = 5
+
+# Seconds allowed for searching, fetching and summarizing a single trend
+trend_timeout_seconds = 60
+
 # Run Button
 if st.sidebar.button("🔍 Run Analysis"):
     with st.spinner("Fetching trends..."):
@@ -184,11 +208,11 @@ Here is the list to analyze: {st.session_state['trends_list']}"""
         st.table(pd.DataFrame(st.session_state['processed_trends'], columns=["Trend"]))
 
     # Summarize content for each trend
-    async def summarize_trend(trend):
+    async def summarize_trend(session, trend):
         search_results = await get_search_results(trend)
-        contents = await fetch_contents(search_results)
+        contents = await fetch_contents(session, search_results)
         combined_content = " ".join(contents)
-        summary = await summarize_with_gpt(combined_content, trend)
+        summary = await summarize_with_gpt(session, combined_content, trend)
         return {"name": trend, "summary": summary}
 
     async def get_search_results(trend):
@@ -199,7 +223,9 @@ Here is the list to analyze: {st.session_state['trends_list']}"""
             "api_key": serpapi_key,
         }
         search = GoogleSearch(params)
-        results = search.get_dict()
+        # The SerpApi client is blocking; run it in a thread so searches for
+        # different trends overlap instead of stalling the event loop
+        results = await asyncio.to_thread(search.get_dict)
         links = []
         if 'organic_results' in results:
             for result in results['organic_results'][:5]:
@@ -208,12 +234,11 @@ Here is the list to analyze: {st.session_state['trends_list']}"""
                     links.append(link)
         return links
 
-    async def fetch_contents(urls):
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for url in urls:
-                tasks.append(fetch_content(session, url))
-            contents = await asyncio.gather(*tasks)
+    async def fetch_contents(session, urls):
+        tasks = []
+        for url in urls:
+            tasks.append(fetch_content(session, url))
+        contents = await asyncio.gather(*tasks)
         return [content for content in contents if content]
 
     async def fetch_content(session, url):
@@ -225,7 +250,7 @@ Here is the list to analyze: {st.session_state['trends_list']}"""
         except:
             return None
 
-    async def summarize_with_gpt(content, trend_name):
+    async def summarize_with_gpt(session, content, trend_name):
         prompt = f"""Read this content and write a short 200 words long summary for the trend "{trend_name}". 
 Format the output as a JSON object with 'name' and 'summary' fields, like this:
 {{
@@ -239,7 +264,7 @@ Provide only the JSON object, without any additional text or explanation."""
             "Authorization": f"Bearer {openai_key}"
         }
 
-        response = await asyncio.to_thread(requests.post,
+        async with session.post(
             "https://api.openai.com/v1/chat/completions",
             headers=headers,
             json={
@@ -247,25 +272,63 @@ Provide only the JSON object, without any additional text or explanation."""
                 "messages": [{"role": "user", "content": prompt}],
                 "temperature": 0.3
             }
-        )
-
-        if response.status_code == 200:
-            content = response.json()['choices'][0]['message']['content'].strip()
-            try:
-                result = json.loads(content)
-                return result['summary']
-            except json.JSONDecodeError:
+        ) as response:
+            if response.status == 200:
+                data = await response.json()
+                content = data['choices'][0]['message']['content'].strip()
+                try:
+                    result = json.loads(content)
+                    return result['summary']
+                except json.JSONDecodeError:
+                    return "Summary not available."
+            else:
                 return "Summary not available."
-        else:
-            return "Summary not available."
 
     # Process trends and generate summaries
     with st.spinner("Generating summaries..."):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        tasks = [summarize_trend(trend) for trend in st.session_state['processed_trends']]
-        st.session_state['trend_summaries'] = loop.run_until_complete(asyncio.gather(*tasks))
-        loop.close()
+        async def summarize_trends(trends, completed):
+            # Bound how many trends hit SerpApi/OpenAI at once; the task group
+            # cancels the remaining work if any trend fails
+            semaphore = asyncio.Semaphore(max_concurrent_trends)
+
+            async def summarize_bounded(session, trend):
+                async with semaphore:
+                    # A hung search or OpenAI request would otherwise hold the
+                    # page for aiohttp's 300s default; give up on that trend
+                    # instead of failing the whole group
+                    try:
+                        async with asyncio.timeout(trend_timeout_seconds):
+                            summary = await summarize_trend(session, trend)
+                    except TimeoutError:
+                        summary = {"name": trend, "summary": "Summary not available."}
+                completed.put(trend)
+                return summary
+
+            # Share one connection pool across all trends so DNS lookups and
+            # keep-alive connections are reused between page fetches
+            connector = aiohttp.TCPConnector(limit=50, limit_per_host=10, ttl_dns_cache=300)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                async with asyncio.TaskGroup() as tg:
+                    tasks = [tg.create_task(summarize_bounded(session, trend)) for trend in trends]
+            return [task.result() for task in tasks]
+
+        trends = st.session_state['processed_trends']
+        progress_bar = st.progress(0.0, text=f"Summarized 0 of {len(trends)} trends")
+
+        # Trends report completion through a queue, because Streamlit elements
+        # can only be updated from the script thread, not the event loop's
+        completed = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            summarize_trends(trends, completed), get_event_loop()
+        )
+        # Unblock the progress loop if the run fails before every trend is done
+        future.add_done_callback(lambda _: completed.put(None))
+        for done_count in range(1, len(trends) + 1):
+            if completed.get() is None:
+                break
+            progress_bar.progress(done_count / len(trends), text=f"Summarized {done_count} of {len(trends)} trends")
+        st.session_state['trend_summaries'] = future.result()
+        progress_bar.empty()
         st.success("Summaries generated.")
 
     with st.expander("Trend Summaries", expanded=False):
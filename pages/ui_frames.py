@@ -2,11 +2,18 @@ import streamlit as st
 import requests
 import os
 import sys
-import toml
 from PIL import Image, ImageDraw, ImageFilter
 import numpy as np
 import cv2  # OpenCV for face detection
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the parent directory to sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+from pages.utils.secrets_loader import load_secrets
 
 # Set page config
 st.set_page_config(page_title="📱 UI Frame Generator", page_icon="📱", layout="centered")
@@ -83,6 +90,19 @@ def get_layer_images(file_key, node_ids, figma_api_token):
         st.stop()
     return response.json().get('images', {})
 
+# Function to download the rendered layer images concurrently
+def download_layer_images(image_urls):
+    def download(item):
+        layer_id, image_url = item
+        image_response = requests.get(image_url)
+        if image_response.status_code == 200:
+            return layer_id, Image.open(BytesIO(image_response.content))
+        return layer_id, None
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = executor.map(download, image_urls.items())
+    return {layer_id: image for layer_id, image in results if image is not None}
+
 # Function to create drop shadow
 def create_drop_shadow(image, opacity, offset_x, offset_y, blur_radius, shadow_spread):
     width = image.width + abs(offset_x) + 2 * (blur_radius + shadow_spread)
@@ -141,8 +161,7 @@ def main():
 
     # Load secrets from the file
     try:
-        with open(secrets_path, "r") as f:
-            secrets = toml.load(f)
+        secrets = load_secrets(secrets_path)
         figma_api_token = secrets["FIGMA_API_TOKEN"]
         figma_file_url = secrets.get("FIGMA_FILE_URL", "")
         page_name = secrets.get("PAGE_NAME", "Screens")
@@ -197,11 +216,7 @@ def main():
             node_ids = [layer['id'] for layer in matching_layers]
             image_urls = get_layer_images(file_key, node_ids, figma_api_token)
             
-            layer_images = {}
-            for layer_id, image_url in image_urls.items():
-                image_response = requests.get(image_url)
-                if image_response.status_code == 200:
-                    layer_images[layer_id] = Image.open(BytesIO(image_response.content))
+            layer_images = download_layer_images(image_urls)
             
             st.session_state.layer_images = layer_images
     else:
@@ -220,11 +235,7 @@ def main():
             node_ids = [layer['id'] for layer in matching_layers]
             image_urls = get_layer_images(file_key, node_ids, figma_api_token)
             
-            layer_images = {}
-            for layer_id, image_url in image_urls.items():
-                image_response = requests.get(image_url)
-                if image_response.status_code == 200:
-                    layer_images[layer_id] = Image.open(BytesIO(image_response.content))
+            layer_images = download_layer_images(image_urls)
             
             st.session_state.layer_images = layer_images
     else:
@@ -288,35 +299,25 @@ def main():
                 alpha_np = np.array(alpha)
                 opaque_threshold = 128
 
+                # Classify every row as opaque or transparent in a single
+                # vectorized pass, then locate the UI edges from that
+                row_opaque = (alpha_np >= opaque_threshold).any(axis=1)
+                opaque_rows = np.flatnonzero(row_opaque)
+                transparent_rows = np.flatnonzero(~row_opaque)
+
                 # Find the bottom edge of the top UI
-                in_top_ui = False
-                top_ui_end = None
-                for i in range(height):
-                    row = alpha_np[i]
-                    if not in_top_ui:
-                        if np.any(row >= opaque_threshold):
-                            in_top_ui = True
-                    else:
-                        if np.all(row < opaque_threshold):
-                            top_ui_end = i
-                            break
-                if top_ui_end is None:
-                    top_ui_end = 0
+                top_ui_end = 0
+                if opaque_rows.size:
+                    rows_after_top = transparent_rows[transparent_rows > opaque_rows[0]]
+                    if rows_after_top.size:
+                        top_ui_end = int(rows_after_top[0])
 
                 # Find the top edge of the bottom UI
-                in_bottom_ui = False
-                bottom_ui_start = None
-                for i in range(height - 1, -1, -1):
-                    row = alpha_np[i]
-                    if not in_bottom_ui:
-                        if np.any(row >= opaque_threshold):
-                            in_bottom_ui = True
-                    else:
-                        if np.all(row < opaque_threshold):
-                            bottom_ui_start = i + 1
-                            break
-                if bottom_ui_start is None:
-                    bottom_ui_start = height
+                bottom_ui_start = height
+                if opaque_rows.size:
+                    rows_before_bottom = transparent_rows[transparent_rows < opaque_rows[-1]]
+                    if rows_before_bottom.size:
+                        bottom_ui_start = int(rows_before_bottom[-1]) + 1
 
                 # Compute the central transparent area
                 central_top = top_ui_end
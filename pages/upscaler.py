@@ -4,7 +4,6 @@ import sys
 import base64
 import replicate
 import requests
-import toml
 from streamlit_image_comparison import image_comparison
 from PIL import Image
 import io
@@ -16,6 +15,7 @@ sys.path.append(parent_dir)
 
 # Now import the workflow module
 from pages.utils.upscale_workflow import get_workflow_json
+from pages.utils.secrets_loader import load_secrets
 
 # Set page configuration
 st.set_page_config(
@@ -30,8 +30,7 @@ st.title("🖼️ Image Upscaler")
 secrets_path = os.path.join(
     os.path.dirname(os.path.dirname(__file__)), ".streamlit", "secrets.toml"
 )
-with open(secrets_path, "r") as f:
-    secrets = toml.load(f)
+secrets = load_secrets(secrets_path)
 api_key = secrets["REPLICATE_API_TOKEN"]
 os.environ["REPLICATE_API_TOKEN"] = api_key
 
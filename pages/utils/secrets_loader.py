@@ -0,0 +1,15 @@
+import os
+import streamlit as st
+import toml
+
+# Streamlit re-runs the whole page on every interaction, so parse
+# secrets.toml once and reuse the result on later reruns. The file's mtime
+# is part of the cache key, so edits to secrets.toml are picked up on the
+# next rerun without a restart
+@st.cache_data(show_spinner=False, max_entries=4)
+def _parse_secrets(secrets_path, mtime):
+    return toml.load(secrets_path)
+
+def load_secrets(secrets_path):
+    # Raises FileNotFoundError when secrets.toml is missing
+    return _parse_secrets(secrets_path, os.path.getmtime(secrets_path))